@@ -1,62 +1,118 @@
 import numpy as np
-from scipy import signal
-import matplotlib.pyplot as plt
+import argparse
+import math
 import sys
 import re
 
-def peaking_eq(fc, gain_db, Q, fs):
-    A = 10**(gain_db/40.0)
-    w0 = 2 * np.pi * fc / fs
-    alpha = np.sin(w0)/(2*Q)
-
-    b0 = 1 + alpha*A
-    b1 = -2*np.cos(w0)
-    b2 = 1 - alpha*A
-    a0 = 1 + alpha/A
-    a1 = -2*np.cos(w0)
-    a2 = 1 - alpha/A
-
-    b = [b0/a0, b1/a0, b2/a0]
-    a = [1, a1/a0, a2/a0]
-    return b, a
-
-def low_shelf_eq(fc, gain_db, Q, fs):
-    A = 10**(gain_db/40.0)
-    w0 = 2 * np.pi * fc / fs
-    sn = np.sin(w0)
-    cs = np.cos(w0)
-    alpha = sn/2 * np.sqrt((A + 1/A)*(1/Q - 1) + 2)
-    beta = 2*np.sqrt(A)*alpha
-
-    b0 =    A*((A+1) - (A-1)*cs + beta)
-    b1 =  2*A*((A-1) - (A+1)*cs)
-    b2 =    A*((A+1) - (A-1)*cs - beta)
-    a0 =        (A+1) + (A-1)*cs + beta
-    a1 =   -2*((A-1) + (A+1)*cs)
-    a2 =        (A+1) + (A-1)*cs - beta
-
-    b = [b0/a0, b1/a0, b2/a0]
-    a = [1, a1/a0, a2/a0]
-    return b, a
+# 10**(x/40) == exp(x * ln(10)/40)
+_LN10_OVER_40 = math.log(10.0) / 40.0
+# 10*log10(x) == log(x) * 10/ln(10)
+_INV_LN10_TIMES_10 = 10.0 / math.log(10.0)
+
+# Anchored at line start so commented-out lines are ignored
+_PREAMP = re.compile(r'^[ \t]*Preamp:\s*([-+]?\d+\.?\d*)\s*dB', re.MULTILINE)
+_POSTAMP = re.compile(r'^[ \t]*Postamp:\s*([-+]?\d+\.?\d*)\s*dB', re.MULTILINE)
+# Status, type, Fc, Gain and optional Q of a filter line in a single pass
+_FILTER = re.compile(r'^[ \t]*Filter\s+\d+:\s+(?P<status>ON|OFF)\s+(?P<type>LSC|LS|HSC|HS|PK)\b'
+                     r'.*?Fc\s+(?P<fc>[-+]?\d+\.?\d*)\s*Hz'
+                     r'.*?Gain\s+(?P<gain>[-+]?\d+\.?\d*)\s*dB'
+                     r'(?:.*?Q\s+(?P<q>[-+]?\d+\.?\d*))?', re.MULTILINE)
+
+# Filter type codes of the band table
+PEAKING = 0
+LOW_SHELF = 1
+HIGH_SHELF = 2
+_TYPE_CODE = {'peaking': PEAKING, 'low_shelf': LOW_SHELF, 'high_shelf': HIGH_SHELF}
+
+def band_coeffs(bands, fs):
+    """
+    Compute the biquads of all bands at once.
+    Returns an (nbands, 5) array of normalized (b0, b1, b2, a1, a2) rows
+    from the RBJ Audio EQ Cookbook peaking and shelf formulas.
+    """
+    types = np.array([_TYPE_CODE[band[0]] for band in bands], dtype=np.int8)
+    fcs = np.array([band[1] for band in bands], dtype=np.float64)
+    gains = np.array([band[2] for band in bands], dtype=np.float64)
+    Qs = np.array([band[3] for band in bands], dtype=np.float64)
 
-def high_shelf_eq(fc, gain_db, Q, fs):
-    A = 10**(gain_db/40.0)
-    w0 = 2 * np.pi * fc / fs
+    A = np.exp(gains * _LN10_OVER_40)
+    w0 = 2 * np.pi * fcs / fs
     sn = np.sin(w0)
     cs = np.cos(w0)
-    alpha = sn/2 * np.sqrt((A + 1/A)*(1/Q - 1) + 2)
+    peak = types == PEAKING
+
+    # Peaking
+    alpha = sn/(2*Qs)
+    pk_b0 = 1 + alpha*A
+    pk_b2 = 1 - alpha*A
+    pk_a0 = 1 + alpha/A
+    pk_a2 = 1 - alpha/A
+    pk_b1 = -2*cs
+
+    # Shelves: s = +1 for low shelf, -1 for high shelf.
+    # Q=1 keeps the unused shelf terms of peaking rows finite.
+    s = np.where(types == HIGH_SHELF, -1.0, 1.0)
+    shelf_Q = np.where(peak, 1.0, Qs)
+    alpha = sn/2 * np.sqrt((A + 1/A)*(1/shelf_Q - 1) + 2)
     beta = 2*np.sqrt(A)*alpha
-
-    b0 =    A*((A+1) + (A-1)*cs + beta)
-    b1 = -2*A*((A-1) + (A+1)*cs)
-    b2 =    A*((A+1) + (A-1)*cs - beta)
-    a0 =        (A+1) - (A-1)*cs + beta
-    a1 =    2*((A-1) - (A+1)*cs)
-    a2 =        (A+1) - (A-1)*cs - beta
-
-    b = [b0/a0, b1/a0, b2/a0]
-    a = [1, a1/a0, a2/a0]
-    return b, a
+    Ap1 = A + 1
+    Am1 = A - 1
+    Ap1cs = Ap1*cs
+    sAm1cs = s*Am1*cs
+
+    sh_b0 =      A*(Ap1 - sAm1cs + beta)
+    sh_b1 =  2*s*A*(Am1 - s*Ap1cs)
+    sh_b2 =      A*(Ap1 - sAm1cs - beta)
+    sh_a0 =         Ap1 + sAm1cs + beta
+    sh_a1 =   -2*s*(Am1 + s*Ap1cs)
+    sh_a2 =         Ap1 + sAm1cs - beta
+
+    a0 = np.where(peak, pk_a0, sh_a0)
+    coeffs = np.empty((len(bands), 5))
+    coeffs[:, 0] = np.where(peak, pk_b0, sh_b0) / a0
+    coeffs[:, 1] = np.where(peak, pk_b1, sh_b1) / a0
+    coeffs[:, 2] = np.where(peak, pk_b2, sh_b2) / a0
+    coeffs[:, 3] = np.where(peak, pk_b1, sh_a1) / a0
+    coeffs[:, 4] = np.where(peak, pk_a2, sh_a2) / a0
+    return coeffs
+
+def specialize_accum_db(coeffs):
+    """
+    Generate accum_db for a fixed set of biquads.
+    The returned function f(s1, s2, out) has one straight-line statement
+    per band with the |H|^2 polynomial constants inlined as literals.
+    """
+    lines = ["def accum_db_specialized(s1, s2, out):"]
+    op = "="
+    for b0, b1, b2, a1, a2 in coeffs.tolist():
+        # For real coefficients |b0 + b1 z^-1 + b2 z^-2|^2 on the unit circle
+        # is (b0 + b1 + b2)^2 - 4(b0 b1 + 4 b0 b2 + b1 b2) s + 16 b0 b2 s^2
+        # with s = sin^2(w/2). Unlike the cos(w) form its terms do not
+        # cancel near w = 0, which keeps narrow bass bands accurate.
+        n = ((b0 + b1 + b2)**2, -4*(b0*b1 + 4*b0*b2 + b1*b2), 16*b0*b2)
+        d = ((1.0 + a1 + a2)**2, -4*(a1 + 4*a2 + a1*a2), 16*a2)
+        lines.append(f"    ratio {op} ({n[0]!r} + {n[1]!r}*s1 + {n[2]!r}*s2)"
+                     f" / ({d[0]!r} + {d[1]!r}*s1 + {d[2]!r}*s2)")
+        op = "*="
+    if op == "=":
+        lines.append("    ratio = 1.0")
+    # Sum of per-band dB is the dB of the product of the power ratios,
+    # so take a single natural log per frequency bin
+    lines.append("    out += np.log(ratio) * _INV_LN10_TIMES_10")
+
+    # repr() of a non-finite coefficient is the bare name nan or inf
+    namespace = {}
+    exec("\n".join(lines), {'np': np, '_INV_LN10_TIMES_10': _INV_LN10_TIMES_10,
+                             'nan': math.nan, 'inf': math.inf}, namespace)
+    return namespace['accum_db_specialized']
+
+def accum_db(coeffs, s1, s2, out):
+    """
+    Add the combined gain in dB of all biquads to out.
+    coeffs is an (nbands, 5) array of normalized (b0, b1, b2, a1, a2) rows,
+    s1 and s2 are sin^2(w/2) and its square over the frequency grid.
+    """
+    specialize_accum_db(coeffs)(s1, s2, out)
 
 def parse_peq_file(filename):
     """
@@ -80,69 +136,41 @@ def parse_peq_file(filename):
 
     try:
         with open(filename, 'r') as f:
-            for line in f:
-                line = line.strip()
-
-                # Parse Preamp
-                if line.startswith('Preamp:'):
-                    match = re.search(r'Preamp:\s*([-+]?\d+\.?\d*)\s*dB\s*', line)
-                    if match:
-                        preamp_db = float(match.group(1))
-
-                # Parse Postamp
-                elif line.startswith('Postamp:'):
-                    match = re.search(r'Postamp:\s*([-+]?\d+\.?\d*)\s*dB\s*', line)
-                    if match:
-                        postamp_db = float(match.group(1))
-
-                # Parse Filter lines
-                elif line.startswith('Filter'):
-                    # Example: Filter 1: ON LSC Fc 40 Hz Gain 5.0 dB Q 1.0
-                    status_match = re.search(r'Filter\s+\d+:\s+(ON|OFF)', line)
-                    if not status_match or status_match.group(1) != 'ON':
-                        continue
-
-                    parts = line.split()
-
-                    # Find filter type (LSC, HSC, PK)
-                    ftype = None
-                    for part in parts:
-                        if part in filter_type_map:
-                            ftype = filter_type_map[part]
-                            break
-
-                    if not ftype:
-                        continue
-
-                    # Extract Fc (frequency)
-                    fc_match = re.search(r'Fc\s+([-+]?\d+\.?\d*)\s*Hz', line)
-                    if not fc_match:
-                        continue
-                    fc = float(fc_match.group(1))
-
-                    # Extract Gain
-                    gain_match = re.search(r'Gain\s+([-+]?\d+\.?\d*)\s*dB', line)
-                    if not gain_match:
-                        continue
-                    gain_db = float(gain_match.group(1))
-
-                    # Extract Q
-                    q_match = re.search(r'Q\s+([-+]?\d+\.?\d*)', line)
-                    if q_match:
-                        Q = float(q_match.group(1))
-                    else:
-                        # If Q is missing:
-                        # PK filters usually require Q, but shelves (LS/HS) might not.
-                        # Default for LS/HS is 0.707 (Butterworth)
-                        if raw_type in ['LS', 'HS', 'LSC', 'HSC']:
-                            Q = 0.707
-                        else:
-                            # If it's a Peak filter without Q, we skip or default (skipping is safer)
-                            print(f"Warning: Skipping Filter (PK without Q): {line}")
-                            continue
-
-                    # Add to bands: (type, fc, gain_db, Q)
-                    bands.append((ftype, fc, gain_db, Q))
+            data = f.read()
+
+        # Parse Preamp, the last line wins
+        for match in _PREAMP.finditer(data):
+            preamp_db = float(match.group(1))
+
+        # Parse Postamp, the last line wins
+        for match in _POSTAMP.finditer(data):
+            postamp_db = float(match.group(1))
+
+        # Parse Filter lines
+        # Example: Filter 1: ON LSC Fc 40 Hz Gain 5.0 dB Q 1.0
+        for match in _FILTER.finditer(data):
+            if match['status'] != 'ON':
+                continue
+
+            ftype = filter_type_map[match['type']]
+            fc = float(match['fc'])
+            gain_db = float(match['gain'])
+
+            if match['q'] is not None:
+                Q = float(match['q'])
+            else:
+                # If Q is missing:
+                # PK filters usually require Q, but shelves (LS/HS) might not.
+                # Default for LS/HS is 0.707 (Butterworth)
+                if ftype != 'peaking':
+                    Q = 0.707
+                else:
+                    # If it's a Peak filter without Q, we skip or default (skipping is safer)
+                    print(f"Warning: Skipping Filter (PK without Q): {match.group(0).strip()}")
+                    continue
+
+            # Add to bands: (type, fc, gain_db, Q)
+            bands.append((ftype, fc, gain_db, Q))
 
     except FileNotFoundError:
         print(f"Error: File '{filename}' not found.")
@@ -155,16 +183,20 @@ def parse_peq_file(filename):
 
 # Main script
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python peq-gain.py <peq_file>")
-        print("\nExample PEQ file format:")
-        print("Preamp: -5.5 dB")
-        print("Filter 1: ON LSC Fc 40 Hz Gain 5.0 dB Q 1.0")
-        print("Filter 2: ON PK Fc 7600 Hz Gain 4.0 dB Q 3.0")
-        print("Postamp: 10.5 dB")
-        sys.exit(1)
-
-    peq_file = sys.argv[1]
+    parser = argparse.ArgumentParser(
+        description='Calculate combined gain of a PEQ file for the preamp parameter',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="Example PEQ file format:\n"
+               "Preamp: -5.5 dB\n"
+               "Filter 1: ON LSC Fc 40 Hz Gain 5.0 dB Q 1.0\n"
+               "Filter 2: ON PK Fc 7600 Hz Gain 4.0 dB Q 3.0\n"
+               "Postamp: 10.5 dB")
+    parser.add_argument('peq_file', type=str, help='Path to the PEQ file')
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+                        help='Only print the analysis, do not import matplotlib or plot')
+    args = parser.parse_args()
+
+    peq_file = args.peq_file
 
     # Parse PEQ file
     preamp_db, bands, postamp_db = parse_peq_file(peq_file)
@@ -199,23 +231,14 @@ if __name__ == "__main__":
 
     w = 2 * np.pi * freqs / fs
 
-    # Calculate combined frequency response
-    H_total = np.ones_like(w, dtype=complex)
-
-    for ftype, fc, gain_db, Q in bands:
-        if ftype == 'peaking':
-            b, a = peaking_eq(fc, gain_db, Q, fs)
-        elif ftype == 'low_shelf':
-            b, a = low_shelf_eq(fc, gain_db, Q, fs)
-        elif ftype == 'high_shelf':
-            b, a = high_shelf_eq(fc, gain_db, Q, fs)
-        else:
-            continue
-
-        _, h = signal.freqz(b, a, worN=w)
-        H_total *= h
+    # Calculate combined frequency response, accumulated directly in dB
+    coeffs = band_coeffs(bands, fs)
+    G_total_db = np.zeros_like(w)
+    # The grid is shared by all bands, so evaluate sin^2(w/2) only once
+    s1 = np.sin(w/2)**2
+    s2 = s1*s1
+    accum_db(coeffs, s1, s2, G_total_db)
 
-    G_total_db = 20 * np.log10(np.abs(H_total))
     max_gain_db = np.max(G_total_db)
     min_gain_db = np.min(G_total_db)
 
@@ -253,17 +276,21 @@ if __name__ == "__main__":
     print(f"  Safe post-EQ amplification: {safe_post_gain_db:.2f} dB")
 
     # Plot
-    plt.rcParams.update({'font.size': 10})
-    plt.rcParams['figure.dpi'] = 300
-
-    plt.figure()
-    plt.semilogx(freqs, G_total_db)
-    plt.title(result)
-    plt.xlabel('Frequency (Hz)')
-    plt.ylabel('Gain (dB)')
-    plt.grid(True, which="both", ls="-", alpha=0.5)
-    plt.axhline(y=0, color='k', linestyle='-', alpha=0.3)
-    if preamp_db != 0:
-        plt.axhline(y=-preamp_db, color='r', linestyle='--', label='Current Preamp Limit')
-    plt.tight_layout()
-    plt.show()
+    if args.plot:
+        # matplotlib is slow to import, so only load it when plotting
+        import matplotlib.pyplot as plt
+
+        plt.rcParams.update({'font.size': 10})
+        plt.rcParams['figure.dpi'] = 300
+
+        plt.figure()
+        plt.semilogx(freqs, G_total_db)
+        plt.title(result)
+        plt.xlabel('Frequency (Hz)')
+        plt.ylabel('Gain (dB)')
+        plt.grid(True, which="both", ls="-", alpha=0.5)
+        plt.axhline(y=0, color='k', linestyle='-', alpha=0.3)
+        if preamp_db != 0:
+            plt.axhline(y=-preamp_db, color='r', linestyle='--', label='Current Preamp Limit')
+        plt.tight_layout()
+        plt.show()
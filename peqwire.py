@@ -1,5 +1,6 @@
-from typing import List
 import argparse
+import functools
+import os
 import re
 import math
 import sys
@@ -20,6 +21,10 @@ MAX_FILTERS=32
 FREQ_MIN=0
 FREQ_MAX=24000
 
+# Regular expressions to match filter blocks and the preamp line in the PEQ file
+FILTER_PATTERN = re.compile(r"Filter \d+:\s*(ON|OFF)\s*([A-Za-z0-9\- ]+)\s*Fc\s*([0-9.]+)\s*Hz\s*Gain\s*([0-9.-]+)\s*dB\s*Q\s*([0-9.]+)")
+PREAMP_PATTERN = re.compile(r"Preamp:\s*(-?[0-9.-]+)\s*dB")
+
 # eq_filter_t
 EQF_OFF=0
 EQF_BELL=1
@@ -94,22 +99,42 @@ PEQ_TO_LSP_FILTER = {
 "Hue Left 0" input, control, 0 to 1, default 0
 """
 
-def debug_write(line: str):
-    if not verbose:
-        return
+def stderr_write_line(line: str):
     sys.stderr.write(line + '\n')
 
-def nodes_to_string(nodes: List) -> str:
-    formatted = ""
-    for d in nodes:
-        formatted += "".join(f'\n                            "{key}" {value}' for key, value in d.items())
-    return formatted
+def discard_line(line: str):
+    pass
+
+# LADSPA control lines of one filter node: mode 0 is RLC (BT), slope 0 is x1
+FILTER_TEMPLATE = (
+    '\n                            "Filter type {which} {nr}" {ftype}'
+    '\n                            "Filter mode {which} {nr}" 0'
+    '\n                            "Filter slope {which} {nr}" 0'
+    '\n                            "Frequency {which} {nr} (Hz)" {frequency}'
+    '\n                            "Filter Width {which} {nr} (oct)" 6'
+    '\n                            "Gain {which} {nr} (G)" {gain}'
+    '\n                            "Quality factor {which} {nr}" {q}'
+    '\n                            "Hue {which} {nr}" 0'
+)
+
+@functools.lru_cache(maxsize=4)
+def read_peq(peq_file_path: str, mtime: float) -> str:
+    """
+    Read a PEQ file. mtime is only part of the cache key.
+    """
+    with open(peq_file_path, 'r') as f:
+        return f.read()
 
-def parse_peq_file(peq_file_path: str, Left_or_Right: str, verbose: bool) -> List:
+def parse_peq_file(peq_file_path: str, Left_or_Right: str, verbose: bool) -> str:
+    """
+    Parse a PEQ file and return the LADSPA control lines of its filter nodes.
+    """
+    # Bind debug output once instead of testing verbose on every call
+    debug_write = stderr_write_line if verbose else discard_line
     nodes = []
-    # Open and read the PEQ file
-    with open(peq_file_path, 'r') as f:
-        peq_data = f.read()
+    # Read the PEQ file, reusing the contents if both channels use the same file
+    peq_file_path = os.path.realpath(peq_file_path)
+    peq_data = read_peq(peq_file_path, os.path.getmtime(peq_file_path))
 
     if Left_or_Right.lower() == 'left':
         which = 'Left'
@@ -120,37 +145,25 @@ def parse_peq_file(peq_file_path: str, Left_or_Right: str, verbose: bool) -> Lis
         exit(1)
 
     #debug_write(repr(peq_data))
-    # Regular expression to match filter blocks in the PEQ file
-    filter_pattern = re.compile(r"Filter \d+:\s*(ON|OFF)\s*([A-Za-z0-9\- ]+)\s*Fc\s*([0-9.]+)\s*Hz\s*Gain\s*([0-9.-]+)\s*dB\s*Q\s*([0-9.]+)")
-    preamp_pattern = re.compile(r"Preamp:\s*(-?[0-9.-]+)\s*dB")
     # Check for Preamp line
-    preamp_match = preamp_pattern.search(peq_data)
+    preamp_match = PREAMP_PATTERN.search(peq_data)
     if preamp_match:
         if len(nodes) == MAX_FILTERS:
             debug_write(f'Reached maximum filter amount {MAX_FILTERS}')
-            return nodes
+            return "".join(nodes)
 
         gain = float(preamp_match.group(1))
         gain_linear = vol_dB_to_linear(gain)
         # Create a High-Shelf node for preamp with Frequency 0 Hz and the preamp gain
-        preamp_node = {
-                f"Filter type {which} {len(nodes)}": EQF_HISHELF,
-                f"Filter mode {which} {len(nodes)}": 0,  # RLC (BT)
-                f"Filter slope {which} {len(nodes)}": 0,  # x1
-                f"Frequency {which} {len(nodes)} (Hz)": 0,  # 0 Hz for preamp
-                f"Filter Width {which} {len(nodes)} (oct)": 6,
-                f"Gain {which} {len(nodes)} (G)": gain_linear,
-                f"Quality factor {which} {len(nodes)}": 1,
-                f"Hue {which} {len(nodes)}": 0
-        }
+        nodes.append(FILTER_TEMPLATE.format(which=which, nr=len(nodes), ftype=EQF_HISHELF,
+                                            frequency=0, gain=gain_linear, q=1))
         debug_write(f'Preamp {gain} dB (linear {gain_linear})')
-        nodes.append(preamp_node)
 
     # Parse each filter block, skipping comments and lines after '#'
-    for match in filter_pattern.finditer(peq_data):
+    for match in FILTER_PATTERN.finditer(peq_data):
         if len(nodes) == MAX_FILTERS:
             debug_write(f'Reached maximum filter amount {MAX_FILTERS}')
-            return nodes
+            return "".join(nodes)
 
         status = match.group(1)
         filter_type_str = match.group(2).strip()
@@ -177,19 +190,11 @@ def parse_peq_file(peq_file_path: str, Left_or_Right: str, verbose: bool) -> Lis
         rounded_frequency = round(frequency)
 
         # Construct the filter node configuration
-        node = {
-            f"Filter type {which} {len(nodes)}": filter_type_nr,
-            f"Filter mode {which} {len(nodes)}": 0,  # RLC (BT)
-            f"Filter slope {which} {len(nodes)}": 0,  # x1
-            f"Frequency {which} {len(nodes)} (Hz)": rounded_frequency,
-            f"Filter Width {which} {len(nodes)} (oct)": 6,
-            f"Gain {which} {len(nodes)} (G)": vol_dB_to_linear(gain),
-            f"Quality factor {which} {len(nodes)}": q_value,
-            f"Hue {which} {len(nodes)}": 0
-        }
-        nodes.append(node)
-
-    return nodes
+        nodes.append(FILTER_TEMPLATE.format(which=which, nr=len(nodes), ftype=filter_type_nr,
+                                            frequency=rounded_frequency,
+                                            gain=vol_dB_to_linear(gain), q=q_value))
+
+    return "".join(nodes)
 
 parser = argparse.ArgumentParser(description='Parse PEQ file (AutoEq / EasyEffects format) and output pipewire ladspa plugin configuration for para_equalizer_x32_lr')
 parser.add_argument('--peq_left', required=True, type=str, help='Path to the left channel peq')
@@ -230,9 +235,7 @@ context_string = f"""context.modules = [
                             \"Equalizer mode\" {EQ_MODE_TO_NR["PEM_FIR"]}"""
 print(context_string)
 
-left_nodes = parse_peq_file(peq_left, 'Left', verbose)
-print(nodes_to_string(left_nodes))
-right_nodes = parse_peq_file(peq_right, 'Right', verbose)
-print(nodes_to_string(right_nodes))
+print(parse_peq_file(peq_left, 'Left', verbose))
+print(parse_peq_file(peq_right, 'Right', verbose))
 print("\n                        }\n                    }\n                ]\n            }\n        }\n    }\n]")
 